@@ -1,26 +1,106 @@
 import os
 import shutil
-import xml.etree.ElementTree as ET
+try:
+    from lxml import etree as ET # C-backed parser, much faster on large projects
+except ImportError:
+    import xml.etree.ElementTree as ET
 import argparse
+import bisect
+import functools
+import mmap
+import stat
+from concurrent.futures import ThreadPoolExecutor
 import sys
 import re # Import regex for more robust replacements
 
 # --- Configuration ---
 SDK_FILES_SUBDIR = "sdk_files" # Subdirectory in the output folder to store copied SDK files
+GENERIC_SDK_PREFIX = "../../../../../../" # Relative path from the project file to the SDK root
+COPY_BUFSIZE = 256 * 1024 # Buffer size for file copies that fall back to a read/write loop
 # ---
 
+# shutil reads COPY_BUFSIZE at call time, so this enlarges the buffer used by copy2/copytree
+# whenever the OS zero-copy path (sendfile, fcopyfile, ...) isn't available.
+shutil.COPY_BUFSIZE = COPY_BUFSIZE
+
+# Encoded once for the bytes-level project file rewrite
+GENERIC_SDK_PREFIX_BYTES = GENERIC_SDK_PREFIX.encode('utf-8')
+SDK_FILES_PREFIX_BYTES = f"{SDK_FILES_SUBDIR}/".encode('utf-8')
+
+# Matches every path-carrying attribute="value" pair in the project file (groups 1-2),
+# or a bare GENERIC_SDK_PREFIX anywhere else (group 3), so all path rewrites are applied
+# in a single pass over the content. A bytes pattern, so it can run directly over a
+# memory-mapped file.
+XML_PATH_PATTERN = re.compile(
+    rb'\b(file_name|c_user_include_directories|linker_section_placement_file'
+    rb'|debug_additional_load_file|debug_register_definition_file)="([^"]*)"'
+    rb'|(' + re.escape(GENERIC_SDK_PREFIX_BYTES) + rb')'
+)
+
+# --- Makefile patterns ---
+TARGET_CFLAGS_LINE = 'CFLAGS += -fno-builtin -fshort-enums' # Additional CFLAGS are inserted after this line
+# Every Makefile rewrite, combined into one alternation so a single sub() call handles
+# the whole file (see replace_makefile_match in main):
+#   original 'PROJ_DIR := ../../..' line -> removed
+#   original 'SDK_ROOT := ../../../../../..' line -> 'PROJ_DIR := ./' + new SDK_ROOT
+#   TARGET_CFLAGS_LINE                   -> kept, followed by the additional CFLAGS
+#   '-I../config'           -> '-I$(PROJ_DIR)/config'
+#   '../config/<file>'      -> '$(PROJ_DIR)/config/<file>'
+#   '../config \' (at EOL)  -> '$(PROJ_DIR)/config \'
+#   '$(PROJ_DIR)/main.c '   -> '$(SDK_ROOT)/main.c '
+MAKEFILE_PATTERN = re.compile(
+    r'^(?P<proj_dir>[ \t]*PROJ_DIR := \.\./\.\./\.\..*\n?)'
+    r'|^(?P<sdk_root>SDK_ROOT[ \t]*:=[ \t]*\.\./\.\./\.\./\.\./\.\./\.\..*\n?)'
+    r'|^(?P<cflags>' + re.escape(TARGET_CFLAGS_LINE) + r'[ \t\r]*(?:\n|\Z))'
+    r'|(?P<config_inc>-I)\.\./config'
+    r'|\.\./config/(?P<config_file>[^\s]+)'
+    r'|(?P<config_dir>\.\./config \\\n)'
+    r'|(?P<main_c>\$\(PROJ_DIR\)/main\.c )',
+    re.MULTILINE
+)
+# Line after which PROJ_DIR/SDK_ROOT are inserted if no SDK_ROOT line was found
+PROJECT_NAME_LINE_PATTERN = re.compile(r'^PROJECT_NAME.*\n?', re.MULTILINE)
+
+# --- Makefile.posix toolchain path ---
+# Bytes, since Makefile.posix is scanned and patched as raw bytes
+ORIGINAL_GCC_PATH_BYTES = b"/usr/local/gcc-arm-none-eabi-9-2020-q2-update/bin/"
+NEW_GCC_PATH_BYTES = b"/usr/local/bin/" # Only replace the directory part
+# os.open defaults to text mode on Windows; OR this into the flags to keep bytes intact
+O_BINARY = getattr(os, 'O_BINARY', 0)
+# Written next to a checked Makefile.posix; holds that file's stat signature so a re-run
+# can skip the scan while the file is unchanged (a fresh copy from the SDK won't match)
+GCC_PATCH_SENTINEL_BYTES = b".gcc_path_patched"
+# Output-relative toolchain dir, encoded once: bytes paths go to os.open/stat without a
+# per-call str -> filesystem encoding step
+SDK_GCC_DIR_BYTES = os.fsencode(os.path.join(SDK_FILES_SUBDIR, 'components', 'toolchain', 'gcc'))
+
+def to_abs_path(path):
+    """Returns path made absolute; already-absolute paths are only normalized, skipping getcwd()."""
+    return os.path.normpath(path) if os.path.isabs(path) else os.path.abspath(path)
+
+@functools.lru_cache(maxsize=None)
 def resolve_path(original_proj_dir, rel_path):
-    """Resolves the absolute path of a file/dir based on the original project directory."""
-    # Normalize path separators for consistency
-    rel_path_norm = os.path.normpath(rel_path)
-    return os.path.abspath(os.path.join(original_proj_dir, rel_path_norm))
+    """
+    Resolves the absolute path of a file/dir based on the original project directory.
+    original_proj_dir must already be absolute, so no abspath (getcwd) is needed.
+    """
+    return os.path.normpath(os.path.join(original_proj_dir, rel_path))
 
+@functools.lru_cache(maxsize=None)
 def create_target_path(output_dir, sdk_subdir, original_rel_path_xml):
     """
     Creates the target absolute path and the new relative path (for XML)
     within the output directory's sdk_subdir, preserving structure.
     Uses forward slashes for the new relative path in XML.
     """
+    # Fast path: SDK paths are normally a run of leading '../' followed by a plain
+    # relative path, so the '..' segments can be sliced off without splitting
+    depth = parent_depth(original_rel_path_xml)
+    inner = original_rel_path_xml[depth * 3:]
+    if inner and '..' not in inner:
+        target_rel_path_unix = f"{sdk_subdir}/" + inner.replace('\\', '/')
+        return os.path.join(output_dir, *target_rel_path_unix.split('/')), target_rel_path_unix
+
     # Normalize separators for splitting, but keep original for replacement key
     path_parts = original_rel_path_xml.replace('\\', '/').split('/')
     rel_to_sdk_root_parts = [part for part in path_parts if part != '..']
@@ -37,50 +117,200 @@ def create_target_path(output_dir, sdk_subdir, original_rel_path_xml):
 
     return target_abs_path, target_rel_path_unix
 
+@functools.lru_cache(maxsize=None)
+def parent_depth(rel_path_xml):
+    """
+    Counts the leading '../' segments of a path as written in the XML.
+    Paths are classified by this single number: 2 or more means an SDK path
+    (the '../../' heuristic), 1 a sibling of the project dir such as ../config.
+    """
+    depth = 0
+    while rel_path_xml.startswith('../', depth * 3):
+        depth += 1
+    return depth
+
+# Memoized filesystem probes. Sources are never modified, and every copy phase in main
+# ends with clear_path_probes(), so repeated checks of the same path cost one stat.
+@functools.lru_cache(maxsize=None)
+def _isfile_cached(abs_path):
+    return os.path.isfile(abs_path)
+
+@functools.lru_cache(maxsize=None)
+def _isdir_cached(abs_path):
+    return os.path.isdir(abs_path)
+
+def clear_path_probes():
+    """Drops cached isfile/isdir results; call after creating or copying anything."""
+    _isfile_cached.cache_clear()
+    _isdir_cached.cache_clear()
+
+def mark_dir_copied(copied_dirs, dir_abs_path):
+    """
+    Records a copied directory in copied_dirs, a sorted list of directory prefixes
+    (each ending in os.sep). The list is kept prefix-free: a directory already covered
+    by a copied ancestor is ignored, and descendants of a new entry are dropped.
+    """
+    prefix = dir_abs_path + os.sep
+    if is_in_copied_dir(copied_dirs, prefix):
+        return
+    pos = bisect.bisect_left(copied_dirs, prefix)
+    end = pos
+    while end < len(copied_dirs) and copied_dirs[end].startswith(prefix):
+        end += 1
+    copied_dirs[pos:end] = [prefix]
+
+def is_in_copied_dir(copied_dirs, abs_path):
+    """Checks whether abs_path lies inside a directory recorded by mark_dir_copied."""
+    # Because the list is sorted and prefix-free, the only candidate ancestor is
+    # the rightmost entry that sorts at or before abs_path.
+    pos = bisect.bisect_right(copied_dirs, abs_path)
+    return pos > 0 and abs_path.startswith(copied_dirs[pos - 1])
+
+
+_made_dirs = set() # Directories known to exist, so makedirs runs once per directory
+
+def ensure_dir(dir_abs_path):
+    """Creates a directory (and its parents) unless this run already made or saw it."""
+    if dir_abs_path in _made_dirs:
+        return
+    os.makedirs(dir_abs_path, exist_ok=True)
+    # makedirs created all ancestors too; remember them as well
+    while dir_abs_path not in _made_dirs:
+        _made_dirs.add(dir_abs_path)
+        parent = os.path.dirname(dir_abs_path)
+        if parent == dir_abs_path:
+            break # Reached the filesystem root
+        dir_abs_path = parent
+
+def link_or_copy(src_abs_path, dest_abs_path):
+    """
+    Hard-links a file instead of copying its data. Falls back to shutil.copy2 when
+    linking is not possible (e.g. across devices or onto an existing file).
+    """
+    try:
+        os.link(src_abs_path, dest_abs_path)
+    except OSError:
+        try:
+            shutil.copy2(src_abs_path, dest_abs_path)
+        except shutil.SameFileError:
+            pass # Already linked by a previous run
+    return dest_abs_path
+
+def copy_unshared(src_abs_path, dest_abs_path):
+    """
+    shutil.copy2 that also works over a hard link left by an earlier --link run:
+    the shared destination is unlinked first, so the copy gets its own data.
+    """
+    try:
+        shutil.copy2(src_abs_path, dest_abs_path)
+    except shutil.SameFileError:
+        os.unlink(dest_abs_path)
+        shutil.copy2(src_abs_path, dest_abs_path)
+    return dest_abs_path
 
-def copy_item(src_abs_path, dest_abs_path):
-    """Copies a file or directory, creating destination directories."""
+def copy_item(src_abs_path, dest_abs_path, link=False):
+    """
+    Copies a file or directory, creating destination directories.
+    With link=True files are hard-linked (see link_or_copy) rather than copied.
+    Returns (copied, message); message is a warning/error for the caller to print,
+    since this may run on a worker thread (see copy_items_parallel).
+    """
     if not os.path.exists(src_abs_path):
-        print(f"Warning: Source item not found, skipping: {src_abs_path}")
-        return False
+        return False, f"Warning: Source item not found, skipping: {src_abs_path}"
 
     dest_dir = os.path.dirname(dest_abs_path)
-    os.makedirs(dest_dir, exist_ok=True)
+    ensure_dir(dest_dir)
 
     try:
-        if os.path.isdir(src_abs_path):
+        if _isdir_cached(src_abs_path):
             # Use copytree for directories, allow overwriting content
-            shutil.copytree(src_abs_path, dest_abs_path, dirs_exist_ok=True)
+            copy_function = link_or_copy if link else copy_unshared
+            shutil.copytree(src_abs_path, dest_abs_path, copy_function=copy_function, dirs_exist_ok=True)
             # print(f"Copied Dir: {src_abs_path} -> {dest_abs_path}")
         else:
             # Use copy2 for files (preserves metadata)
-            shutil.copy2(src_abs_path, dest_abs_path)
+            if link:
+                link_or_copy(src_abs_path, dest_abs_path)
+            else:
+                copy_unshared(src_abs_path, dest_abs_path)
             # print(f"Copied File: {src_abs_path} -> {dest_abs_path}")
-        return True
+        return True, None
     except Exception as e:
-        print(f"Error copying {src_abs_path} to {dest_abs_path}: {e}")
-        return False
+        return False, f"Error copying {src_abs_path} to {dest_abs_path}: {e}"
 
-def main(project_file_path, output_dir, makefile_dir=None): # Add makefile_dir parameter
-    abs_project_file_path = os.path.abspath(project_file_path)
+def file_contains(file_path, needle):
+    """Checks whether a file contains the bytes needle, without reading it into memory."""
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return False # Empty files can't be memory-mapped
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return mm.find(needle) != -1
+
+def stat_signature(file_stat):
+    """Identifies one version of a file; copying over it or rewriting it changes the result."""
+    return f"{file_stat.st_size} {file_stat.st_mtime_ns} {file_stat.st_ino}".encode('ascii')
+
+def copy_items_parallel(copy_jobs):
+    """
+    Runs copy_item for every (src_abs_path, dest_abs_path, link) tuple on a thread pool.
+    Copying is dominated by syscalls that release the GIL, so threads overlap well.
+    Returns the (copied, message) results in the same order as copy_jobs; nothing is
+    printed from the workers, so the caller logs in job order from its own thread.
+    """
+    if not copy_jobs:
+        return []
+    max_workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda job: copy_item(*job), copy_jobs))
+
+def run_copy_jobs(copy_jobs, link_sdk):
+    """
+    Runs queued (src_abs_path, dest_abs_path, kind, replacement) jobs on the thread pool,
+    hard-linking the 'sdk_*' kinds when link_sdk is set. Yields the copied flags in job
+    order, printing each job's warning just before its flag so the caller's follow-up
+    messages stay next to it.
+    """
+    if copy_jobs:
+        print(f"Copying {len(copy_jobs)} queued item(s)...")
+    results = copy_items_parallel([
+        (src_abs_path, dest_abs_path, link_sdk and kind.startswith('sdk_'))
+        for src_abs_path, dest_abs_path, kind, _ in copy_jobs
+    ])
+    clear_path_probes()
+    for copied, message in results:
+        if message:
+            print(message)
+        yield copied
+
+def main(project_file_path, output_dir, makefile_dir=None, link_sdk=False): # Add makefile_dir parameter
+    # The made-dirs set and the isfile/isdir caches only hold for a single run; a previous
+    # call of main (or anything else) may have removed those paths since
+    _made_dirs.clear()
+    clear_path_probes()
+
+    # Make every base path absolute exactly once; all derived paths are built with
+    # join + normpath, which avoids a getcwd() syscall per path. The command line already
+    # passes absolute paths, so this only matters when main is called directly.
+    abs_project_file_path = to_abs_path(project_file_path)
+    output_dir = to_abs_path(output_dir)
     original_proj_dir = os.path.dirname(abs_project_file_path)
     project_filename = os.path.basename(abs_project_file_path)
 
     # Determine the directory containing the Makefile
     if makefile_dir:
-        original_makefile_base_dir = os.path.abspath(makefile_dir)
+        original_makefile_base_dir = to_abs_path(makefile_dir)
         print(f"Using specified Makefile directory: {original_makefile_base_dir}")
     else:
         original_makefile_base_dir = original_proj_dir # Default to project directory
         print(f"Using project directory for Makefile: {original_makefile_base_dir}")
 
     print(f"Input Project: {abs_project_file_path}")
-    print(f"Output Directory: {os.path.abspath(output_dir)}")
+    print(f"Output Directory: {output_dir}")
 
     # Create output directory
-    os.makedirs(output_dir, exist_ok=True)
+    ensure_dir(output_dir)
     sdk_files_abs_dir = os.path.join(output_dir, SDK_FILES_SUBDIR)
-    os.makedirs(sdk_files_abs_dir, exist_ok=True)
+    ensure_dir(sdk_files_abs_dir)
 
     # Destination project file path
     dest_project_file_path = os.path.join(output_dir, project_filename)
@@ -91,151 +321,188 @@ def main(project_file_path, output_dir, makefile_dir=None): # Add makefile_dir p
     makefile_common_src_abs = resolve_path(original_proj_dir, makefile_common_rel_path_xml)
     # Determine destination path within sdk_files subdir
     makefile_common_dest_abs, _ = create_target_path(output_dir, SDK_FILES_SUBDIR, makefile_common_rel_path_xml)
-    if copy_item(makefile_common_src_abs, makefile_common_dest_abs):
+    copied, message = copy_item(makefile_common_src_abs, makefile_common_dest_abs, link=link_sdk)
+    if message:
+        print(message)
+    if copied:
         print(f"  Copied Makefile.common to: {makefile_common_dest_abs}")
     else:
         print(f"  Warning: Failed to copy Makefile.common from: {makefile_common_src_abs}")
+    clear_path_probes()
     # ---
 
-    # --- Read Original Project Content ---
-    try:
-        with open(abs_project_file_path, 'r', encoding='utf-8') as f:
-            original_project_content = f.read()
-    except FileNotFoundError:
-        print(f"Error: Project file not found at {abs_project_file_path}")
-        sys.exit(1)
-    except Exception as e:
-        print(f"Error reading project file {abs_project_file_path}: {e}")
-        sys.exit(1)
-
     # --- Parse Original Project File (for information only) ---
+    # Stream the XML once, keeping only what the analysis needs: the attributes of the
+    # Common configuration and the file_name of every <file> element.
+    parse_ok = True
+    common_config = None # Attribute dict of <configuration Name='Common'>
+    file_entries = [] # file_name attributes of <file> elements, in document order
     try:
         # Use the original file path for parsing to get accurate info
-        tree = ET.parse(abs_project_file_path)
-        root = tree.getroot()
+        for _, elem in ET.iterparse(abs_project_file_path, events=('end',)):
+            if elem.tag == 'file':
+                file_entries.append(elem.get('file_name'))
+                elem.clear()
+            elif elem.tag == 'configuration':
+                if common_config is None and elem.get('Name') == 'Common':
+                    common_config = dict(elem.attrib)
+                elem.clear()
     except ET.ParseError as e:
         print(f"Error parsing project file XML structure (for analysis): {abs_project_file_path}. {e}")
-        root = None # Indicate parsing failed, proceed with caution
+        parse_ok = False # Indicate parsing failed, proceed with caution
     except Exception as e:
          print(f"Unexpected error parsing project file XML: {e}")
-         root = None
+         parse_ok = False
 
     copied_items_abs = set() # Track absolute paths of copied items to avoid re-copying
+    copied_dirs_abs = [] # Sorted prefixes of copied directories; their contents count as copied
     # Add the explicitly copied Makefile.common to the set to avoid re-copying if listed elsewhere
     if os.path.exists(makefile_common_src_abs):
         copied_items_abs.add(makefile_common_src_abs)
 
-    paths_to_replace = {} # Store {original_path_in_xml: new_path_in_xml}
+    paths_to_replace = {} # Store {(attribute_name, original_value_in_xml): new_value_in_xml}
+    # Copies found during analysis, run together on a thread pool at the end of each section.
+    # Each entry is (src_abs_path, dest_abs_path, kind, replacement), where replacement
+    # is a (key, new_value) pair for paths_to_replace, applied only if the copy succeeds.
+    # Sources are marked as copied when queued so later entries don't queue them twice,
+    # and unmarked again if the copy fails.
+    copy_jobs = []
 
     # --- Copy Essential Local Dirs First (e.g., config) ---
     config_rel_path_xml = '../config' # Use XML style path for finding source
     config_src_abs_path = resolve_path(original_proj_dir, config_rel_path_xml)
     # Destination should be directly inside output_dir
-    config_dest_abs_path = os.path.abspath(os.path.join(output_dir, 'config')) # Destination is output_dir/config
+    config_dest_abs_path = os.path.join(output_dir, 'config') # Destination is output_dir/config
+    config_src_prefix = config_src_abs_path + os.sep # Precomputed for the per-file containment check
     config_copied = False
-    if os.path.isdir(config_src_abs_path):
+    if _isdir_cached(config_src_abs_path):
         print("Copying config directory...")
-        if copy_item(config_src_abs_path, config_dest_abs_path):
+        copied, message = copy_item(config_src_abs_path, config_dest_abs_path)
+        if message:
+            print(message)
+        if copied:
             config_copied = True
             # Track the source absolute path to prevent re-copying its contents
             copied_items_abs.add(config_src_abs_path)
-            # Add contained files using their source absolute paths
-            for root_dir, _, files in os.walk(config_src_abs_path):
-                 for file in files:
-                     copied_items_abs.add(os.path.join(root_dir, file))
+            # Everything below it counts as copied, without walking the tree
+            mark_dir_copied(copied_dirs_abs, config_src_abs_path)
             # The path "../config" in the XML file's include paths usually remains correct
             # relative to the moved project file, so no replacement needed for the include path itself.
         else:
              print(f"  Failed to copy config directory: {config_src_abs_path}")
+        clear_path_probes()
 
 
-    if root is not None:
+    if parse_ok:
         # --- Process configurations (Common) - Copy SDK Include Dirs ---
         print("Analyzing and copying SDK include directories...")
-        common_config = root.find(".//configuration[@Name='Common']")
         if common_config is not None:
             include_dirs_attr = 'c_user_include_directories'
             original_includes_str = common_config.get(include_dirs_attr, '')
             original_includes = original_includes_str.split(';')
             new_includes_list = [] # Build the new list for the attribute value
             needs_include_update = False
-
-            for inc_path_xml in original_includes: # Path exactly as in XML (forward slashes expected)
-                if not inc_path_xml: continue
-
-                # Skip the specific path "../../../config" if found
-                if inc_path_xml == '../../../config':
-                    needs_include_update = True # Mark for update as we are removing an entry
-                    print(f"Scheduled removal of include path: '{inc_path_xml}'")
-                    continue # Skip adding this path to the new list
-
-                src_abs_path = resolve_path(original_proj_dir, inc_path_xml)
-
-                # Identify SDK include paths (heuristic: starts with ../../)
-                is_sdk_include = inc_path_xml.startswith('../../')
-
-                if is_sdk_include:
-                    if os.path.isdir(src_abs_path): # Only copy if it's a directory
-                        dest_abs_path, new_rel_path_xml = create_target_path(output_dir, SDK_FILES_SUBDIR, inc_path_xml)
-                        if src_abs_path not in copied_items_abs:
-                            print(f"Copying SDK include directory: {inc_path_xml}")
-                            if copy_item(src_abs_path, dest_abs_path):
-                                copied_items_abs.add(src_abs_path)
-                                # Add contained files to avoid individual copying later
-                                for root_dir, _, files in os.walk(src_abs_path):
-                                    for file in files:
-                                        copied_items_abs.add(os.path.join(root_dir, file))
-                            else:
-                                print(f"  Failed to copy SDK include directory: {src_abs_path}")
-                        # else: Already copied (e.g., nested include paths)
-
-                        # Always update the path in the list
-                        new_includes_list.append(new_rel_path_xml)
-                        if new_rel_path_xml != inc_path_xml:
-                            needs_include_update = True
+            include_copy_jobs = [] # Copied as a batch once all include paths are analyzed
+            queued_include_dirs = [] # Prefix-free like copied_dirs_abs, but for queued copies
+
+            # Cheap pre-scan: without SDK ('../../...') or '../config' entries, every path is
+            # kept as is, so the resolve/isdir work of the loop below can be skipped entirely.
+            has_include_work = any(parent_depth(p) >= 2 or p == '../config' for p in original_includes)
+            if has_include_work:
+                for inc_path_xml in original_includes: # Path exactly as in XML (forward slashes expected)
+                    if not inc_path_xml: continue
+
+                    # Skip the specific path "../../../config" if found
+                    if inc_path_xml == '../../../config':
+                        needs_include_update = True # Mark for update as we are removing an entry
+                        print(f"Scheduled removal of include path: '{inc_path_xml}'")
+                        continue # Skip adding this path to the new list
+
+                    # Identify SDK include paths (heuristic: starts with ../../)
+                    is_sdk_include = parent_depth(inc_path_xml) >= 2
+
+                    if is_sdk_include:
+                        src_abs_path = resolve_path(original_proj_dir, inc_path_xml) # Only SDK paths need resolving
+                        if _isdir_cached(src_abs_path): # Only copy if it's a directory
+                            dest_abs_path, new_rel_path_xml = create_target_path(output_dir, SDK_FILES_SUBDIR, inc_path_xml)
+                            # The trailing separator also catches the same directory queued twice
+                            if (src_abs_path not in copied_items_abs and not is_in_copied_dir(copied_dirs_abs, src_abs_path)
+                                    and not is_in_copied_dir(queued_include_dirs, src_abs_path + os.sep)):
+                                print(f"Copying SDK include directory: {inc_path_xml}")
+                                include_copy_jobs.append((src_abs_path, dest_abs_path, 'sdk_include_dir', None))
+                                mark_dir_copied(queued_include_dirs, src_abs_path)
+                            # else: Already copied (e.g., nested include paths)
+
+                            # Always update the path in the list
+                            new_includes_list.append(new_rel_path_xml)
+                            if new_rel_path_xml != inc_path_xml:
+                                needs_include_update = True
+                        else:
+                            # Path exists but isn't a directory, or doesn't exist
+                            print(f"Warning: SDK include path is not a directory or not found, keeping original: {inc_path_xml}")
+                            new_includes_list.append(inc_path_xml) # Keep original path
+                    elif inc_path_xml == '../config':
+                        # Change local config include path from '../config' to 'config'
+                        new_config_include_path = 'config' # Changed from './config' to just 'config' for consistency
+                        new_includes_list.append(new_config_include_path)
+                        if new_config_include_path != inc_path_xml:
+                             needs_include_update = True
+                             print(f"Scheduled include path update: '{inc_path_xml}' -> '{new_config_include_path}'")
                     else:
-                        # Path exists but isn't a directory, or doesn't exist
-                        print(f"Warning: SDK include path is not a directory or not found, keeping original: {inc_path_xml}")
-                        new_includes_list.append(inc_path_xml) # Keep original path
-                elif inc_path_xml == '../config':
-                    # Change local config include path from '../config' to 'config'
-                    new_config_include_path = 'config' # Changed from './config' to just 'config' for consistency
-                    new_includes_list.append(new_config_include_path)
-                    if new_config_include_path != inc_path_xml:
-                         needs_include_update = True
-                         print(f"Scheduled include path update: '{inc_path_xml}' -> '{new_config_include_path}'")
-                else:
-                    # Keep other paths (e.g., '.') as they are relative to the project file
-                    new_includes_list.append(inc_path_xml)
+                        # Keep other paths (e.g., '.') as they are relative to the project file
+                        new_includes_list.append(inc_path_xml)
+
+            # --- Copy the Queued SDK Include Dirs in Parallel ---
+            # Done before the <file> pass and recorded as copied only on success, so files
+            # below a directory that failed to copy are still copied individually.
+            pending_include_jobs = include_copy_jobs
+            while pending_include_jobs:
+                # A nested include dir queued before its ancestor is covered by the ancestor's
+                # copytree; running both would copy that subtree twice, from two threads at once
+                round_dirs = []
+                for job in pending_include_jobs:
+                    mark_dir_copied(round_dirs, job[0])
+                round_jobs = [job for job in pending_include_jobs if not is_in_copied_dir(round_dirs, job[0])]
+                for (src_abs_path, _, _, _), copied in zip(round_jobs, run_copy_jobs(round_jobs, link_sdk)):
+                    if copied:
+                        copied_items_abs.add(src_abs_path)
+                        # Mark contained files as copied to avoid individual copying later
+                        mark_dir_copied(copied_dirs_abs, src_abs_path)
+                    else:
+                        print(f"  Failed to copy SDK include directory: {src_abs_path}")
+                # Nested dirs left to an ancestor whose copy failed get a round of their own
+                pending_include_jobs = [job for job in pending_include_jobs
+                                        if is_in_copied_dir(round_dirs, job[0])
+                                        and not is_in_copied_dir(copied_dirs_abs, job[0])]
 
             # Store the replacement for the entire attribute value if needed
             if needs_include_update:
                 new_includes_str = ';'.join(new_includes_list)
                 # Store replacement using exact attribute=value format
-                paths_to_replace[f'{include_dirs_attr}="{original_includes_str}"'] = f'{include_dirs_attr}="{new_includes_str}"'
+                paths_to_replace[(include_dirs_attr, original_includes_str)] = new_includes_str
                 print(f"Scheduled update for {include_dirs_attr}")
 
             # --- Process <file> elements ---
             print("Analyzing and copying source files listed in <file> tags...")
-            files_processed_count = 0
-            for file_element in root.findall('.//file'):
-                original_rel_path_xml = file_element.get('file_name') # Path exactly as in XML
+            for original_rel_path_xml in file_entries: # Path exactly as in XML
                 if not original_rel_path_xml: continue
 
                 src_abs_path = resolve_path(original_proj_dir, original_rel_path_xml)
 
                 # Check if this file is inside the config directory that was copied
                 is_in_copied_config = False
-                if config_copied and src_abs_path.startswith(config_src_abs_path + os.sep):
+                if config_copied and src_abs_path.startswith(config_src_prefix):
                     is_in_copied_config = True
 
                 # Skip if already copied, UNLESS it's in the config dir (needs path update)
-                if src_abs_path in copied_items_abs and not is_in_copied_config:
+                already_copied = src_abs_path in copied_items_abs or is_in_copied_dir(copied_dirs_abs, src_abs_path)
+                if already_copied and not is_in_copied_config:
                     # print(f"Skipping already copied item: {original_rel_path_xml}")
                     continue
 
                 # Heuristic check if it's an SDK file needing relocation
-                is_sdk_file = original_rel_path_xml.startswith('../../')
+                depth = parent_depth(original_rel_path_xml)
+                is_sdk_file = depth >= 2
 
                 # Handle local files
                 is_local_file = not is_sdk_file
@@ -243,15 +510,14 @@ def main(project_file_path, output_dir, makefile_dir=None): # Add makefile_dir p
                 if is_sdk_file:
                     # Handle SDK files (copy to sdk_files, schedule path replacement)
                     dest_abs_path, new_rel_path_xml = create_target_path(output_dir, SDK_FILES_SUBDIR, original_rel_path_xml)
-                    if src_abs_path not in copied_items_abs: # Avoid re-copying if part of copied include dir
-                        if copy_item(src_abs_path, dest_abs_path):
-                            copied_items_abs.add(src_abs_path)
-                            files_processed_count += 1
-                        else:
-                            continue # Skip replacement if copy failed
-
-                    # Always schedule replacement for SDK files
-                    paths_to_replace[f'file_name="{original_rel_path_xml}"'] = f'file_name="{new_rel_path_xml}"'
+                    replacement = (('file_name', original_rel_path_xml), new_rel_path_xml)
+                    if not already_copied: # Avoid re-copying if part of copied include dir
+                        # Replacement is skipped if the copy fails
+                        copy_jobs.append((src_abs_path, dest_abs_path, 'sdk_file', replacement))
+                        copied_items_abs.add(src_abs_path)
+                    else:
+                        # Always schedule replacement for SDK files
+                        paths_to_replace[replacement[0]] = replacement[1]
 
                 elif is_local_file:
                     # Handle local files (../main.c, flash_placement.xml, ../config/sdk_config.h etc.)
@@ -260,9 +526,9 @@ def main(project_file_path, output_dir, makefile_dir=None): # Add makefile_dir p
                         # Need to update its path relative to the new project location.
                         # Original: ../config/file.h -> New: config/file.h
                         # Remove the leading '../'
-                        if original_rel_path_xml.startswith('../'):
+                        if depth == 1:
                             new_rel_path_xml = original_rel_path_xml[3:] # Remove '../'
-                            paths_to_replace[f'file_name="{original_rel_path_xml}"'] = f'file_name="{new_rel_path_xml}"'
+                            paths_to_replace[('file_name', original_rel_path_xml)] = new_rel_path_xml
                             print(f"Scheduled path update for config file: {original_rel_path_xml} -> {new_rel_path_xml}")
                         else:
                             # Path didn't start with ../, unlikely for config but handle defensively
@@ -271,13 +537,21 @@ def main(project_file_path, output_dir, makefile_dir=None): # Add makefile_dir p
                     else:
                         # Local file NOT in the config dir (e.g., ../main.c, flash_placement.xml)
                         # Calculate destination relative to output_dir root, maintaining structure
-                        dest_abs_path = os.path.abspath(os.path.join(output_dir, os.path.normpath(original_rel_path_xml)))
-                        if copy_item(src_abs_path, dest_abs_path):
-                            copied_items_abs.add(src_abs_path) # Mark source as handled
-                            files_processed_count += 1
+                        dest_abs_path = os.path.normpath(os.path.join(output_dir, original_rel_path_xml))
+                        copy_jobs.append((src_abs_path, dest_abs_path, 'local_file', None))
+                        copied_items_abs.add(src_abs_path) # Mark source as handled
                         # No path change needed in XML for these files, as their relative path
                         # to the project file remains the same (e.g., ../main.c stays ../main.c)
 
+            # --- Run the Queued File Copies in Parallel ---
+            files_processed_count = 0
+            for (src_abs_path, _, kind, replacement), copied in zip(copy_jobs, run_copy_jobs(copy_jobs, link_sdk)):
+                if not copied:
+                    copied_items_abs.discard(src_abs_path) # Later sections may still copy it
+                    continue # Skip replacement if copy failed
+                files_processed_count += 1
+                if replacement:
+                    paths_to_replace[replacement[0]] = replacement[1]
             print(f"Analyzed and copied/processed {files_processed_count} individual source files.")
 
             # --- Process Other Paths (Linker Script, Debug Files) ---
@@ -287,6 +561,7 @@ def main(project_file_path, output_dir, makefile_dir=None): # Add makefile_dir p
                 'debug_additional_load_file',
                 'debug_register_definition_file'
             ]
+            other_copy_jobs = []
             for attr_name in path_attrs:
                 original_path_xml = common_config.get(attr_name) # Path as in XML
                 if not original_path_xml: continue
@@ -294,82 +569,118 @@ def main(project_file_path, output_dir, makefile_dir=None): # Add makefile_dir p
                 src_abs_path = resolve_path(original_proj_dir, original_path_xml)
 
                 # Skip if already copied
-                if src_abs_path in copied_items_abs:
+                if src_abs_path in copied_items_abs or is_in_copied_dir(copied_dirs_abs, src_abs_path):
                      # Check if it's flash_placement.xml which might be listed here and also as a <file>
                      # If it was copied as a local file, its path doesn't need changing.
                      continue
 
 
                 # Check if it's an SDK path or local path
-                is_sdk_path = original_path_xml.startswith('../../')
+                is_sdk_path = parent_depth(original_path_xml) >= 2
                 is_local_path = not is_sdk_path
 
                 if is_sdk_path:
                     dest_abs_path, new_rel_path_xml = create_target_path(output_dir, SDK_FILES_SUBDIR, original_path_xml)
-                    if copy_item(src_abs_path, dest_abs_path):
-                        copied_items_abs.add(src_abs_path)
-                        # Store attribute=value replacement pair
-                        paths_to_replace[f'{attr_name}="{original_path_xml}"'] = f'{attr_name}="{new_rel_path_xml}"'
-                        print(f"Scheduled update for {attr_name} path: {original_path_xml} -> {new_rel_path_xml}")
+                    # Store attribute=value replacement pair, applied once the copy succeeds
+                    replacement = ((attr_name, original_path_xml), new_rel_path_xml)
+                    other_copy_jobs.append((src_abs_path, dest_abs_path, 'sdk_path', replacement))
+                    copied_items_abs.add(src_abs_path)
                 elif is_local_path:
                     # e.g., flash_placement.xml (might be listed here too)
                     # Calculate destination relative to output_dir root
-                    dest_abs_path = os.path.abspath(os.path.join(output_dir, os.path.normpath(original_path_xml)))
-                    if copy_item(src_abs_path, dest_abs_path):
-                        copied_items_abs.add(src_abs_path)
+                    dest_abs_path = os.path.normpath(os.path.join(output_dir, original_path_xml))
+                    other_copy_jobs.append((src_abs_path, dest_abs_path, 'local_path', None))
+                    copied_items_abs.add(src_abs_path)
                     # No path change needed in XML attribute for these local files relative to project
 
+            for (src_abs_path, _, kind, replacement), copied in zip(other_copy_jobs, run_copy_jobs(other_copy_jobs, link_sdk)):
+                if not copied:
+                    copied_items_abs.discard(src_abs_path)
+                    continue
+                if replacement:
+                    (attr_name, original_path_xml), new_rel_path_xml = replacement
+                    paths_to_replace[replacement[0]] = new_rel_path_xml
+                    print(f"Scheduled update for {attr_name} path: {original_path_xml} -> {new_rel_path_xml}")
+
         else:
              print("Warning: Could not find <configuration Name='Common'> for analysis.")
 
     else:
         print("Skipping XML analysis due to parsing errors. Only directory copies performed.")
 
-
-    # --- Perform String Replacements on Content ---
-    print("Performing path replacements in project file content...")
-    modified_project_content = original_project_content
+    # --- Read Original Project Content (only if it may need rewriting) ---
+    # With nothing scheduled, the only possible rewrite is the generic SDK prefix, which is
+    # probed on a memory map instead of reading the whole file.
+    # The content is processed as bytes end to end: all path tokens are plain text, so
+    # there is no need to decode the file into a str and encode it again on write.
     replacement_count = 0
-    # Sort replacements by length descending to handle nested paths correctly
-    sorted_replacements = sorted(paths_to_replace.items(), key=lambda item: len(item[0]), reverse=True)
-
-    for original_attr_val, new_attr_val in sorted_replacements:
-        # Use regex to replace attribute="value" safely, handling potential variations
-        # Escape special regex characters in the original value part
-        original_value = original_attr_val.split('="', 1)[1][:-1] # Extract value
-        attr_name = original_attr_val.split('="', 1)[0]
-        # Pattern: attr_name="<escaped_original_value>"
-        # Need to escape regex metacharacters in the value being searched for
-        pattern = re.escape(attr_name) + r'="' + re.escape(original_value) + r'"'
-
-        # Perform replacement using re.sub for safety
-        modified_project_content_new, num_subs = re.subn(pattern, new_attr_val, modified_project_content, flags=re.IGNORECASE)
-
-        if num_subs > 0:
-            modified_project_content = modified_project_content_new
-            print(f"  Replaced {num_subs} instance(s) of '{original_attr_val}' with '{new_attr_val}'")
+    replaced_counts = {} # {(attribute_name, original_value): number of substitutions}
+    # paths_to_replace encoded once, keyed like the groups of XML_PATH_PATTERN
+    paths_to_replace_bytes = {
+        (attr_name.encode('utf-8'), original_value.encode('utf-8')): new_value.encode('utf-8')
+        for (attr_name, original_value), new_value in paths_to_replace.items()
+    }
+
+    generic_replacements_made = 0
+
+    def replace_path(match):
+        # Scheduled attribute rewrites and the generic SDK prefix replacement are both
+        # handled here, so the content is scanned once. The generic prefix is also
+        # replaced inside (rewritten) attribute values, as a separate pass would.
+        nonlocal generic_replacements_made
+        if match[3] is not None:
+            generic_replacements_made += 1
+            return SDK_FILES_PREFIX_BYTES
+        original = match[2] # Bound once: each match[2] call builds a new bytes object
+        key = (match[1], original)
+        value = paths_to_replace_bytes.get(key)
+        if value is not None:
+            replaced_counts[key] = replaced_counts.get(key, 0) + 1
+        else:
+            value = original
+        # split/join replaces and counts in one scan (count + replace would be two)
+        parts = value.split(GENERIC_SDK_PREFIX_BYTES)
+        if len(parts) > 1:
+            generic_replacements_made += len(parts) - 1
+            value = SDK_FILES_PREFIX_BYTES.join(parts)
+        elif value is original:
+            return match[0] # Nothing to rewrite in this attribute
+        return match[1] + b'="' + value + b'"'
+
+    try:
+        needs_rewrite = bool(paths_to_replace) or file_contains(abs_project_file_path, GENERIC_SDK_PREFIX_BYTES)
+        if needs_rewrite:
+            print("Performing path replacements in project file content...")
+            # The pass runs directly over the memory-mapped file, so the original content is
+            # never read into the Python heap; only the result is materialized.
+            with open(abs_project_file_path, 'rb') as f, \
+                 mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as project_map:
+                modified_project_content = XML_PATH_PATTERN.sub(replace_path, project_map)
+    except FileNotFoundError:
+        print(f"Error: Project file not found at {abs_project_file_path}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error reading project file {abs_project_file_path}: {e}")
+        sys.exit(1)
+
+    if needs_rewrite:
+        for key, num_subs in replaced_counts.items():
+            attr_name, original_value = (part.decode('utf-8') for part in key)
+            new_value = paths_to_replace_bytes[key].decode('utf-8')
+            print(f"  Replaced {num_subs} instance(s) of '{attr_name}=\"{original_value}\"' with '{attr_name}=\"{new_value}\"'")
             replacement_count += num_subs
-        # else:
-        #     print(f"  Info: Did not find '{original_attr_val}' for replacement.")
-
-    # --- Final generic SDK path replacement ---
-    print(f"Performing final generic SDK path replacement ('../../../../../../' -> '{SDK_FILES_SUBDIR}/')...")
-    generic_sdk_prefix = "../../../../../../"
-    new_sdk_prefix = f"{SDK_FILES_SUBDIR}/"
-    count_before = modified_project_content.count(generic_sdk_prefix)
-    modified_project_content = modified_project_content.replace(generic_sdk_prefix, new_sdk_prefix)
-    count_after = modified_project_content.count(generic_sdk_prefix) # Should be 0 if all replaced
-    generic_replacements_made = count_before - count_after
-    if generic_replacements_made > 0:
-        print(f"  Replaced {generic_replacements_made} instance(s) of '{generic_sdk_prefix}' with '{new_sdk_prefix}'")
-        replacement_count += generic_replacements_made
+
+        # --- Final generic SDK path replacement (done in the same pass above) ---
+        if generic_replacements_made > 0:
+            print(f"  Replaced {generic_replacements_made} instance(s) of '{GENERIC_SDK_PREFIX}' with '{SDK_FILES_SUBDIR}/'")
+            replacement_count += generic_replacements_made
 
     # --- Write Modified Content to Destination ---
-    # The DOCTYPE and comments are preserved because we started with original_project_content
+    # The DOCTYPE and comments are preserved because we started from the original file content
     if replacement_count > 0:
         print(f"Total replacements made: {replacement_count}")
         try:
-            with open(dest_project_file_path, 'w', encoding='utf-8') as f:
+            with open(dest_project_file_path, 'wb') as f:
                 f.write(modified_project_content)
             print(f"Successfully saved modified project file: {dest_project_file_path}")
         except Exception as e:
@@ -390,20 +701,21 @@ def main(project_file_path, output_dir, makefile_dir=None): # Add makefile_dir p
     original_makefile_path = os.path.join(original_makefile_base_dir, 'Makefile')
     dest_makefile_path = os.path.join(output_dir, 'Makefile')
 
-    if os.path.isfile(original_makefile_path):
+    if _isfile_cached(original_makefile_path):
         try:
             shutil.copy2(original_makefile_path, dest_makefile_path)
             print(f"  Copied Makefile from '{original_makefile_path}' to: {dest_makefile_path}")
 
             # --- Copy Linker Script (.ld file) ---
             linker_script_copied = False
-            for item in os.listdir(original_makefile_base_dir):
-                if item.endswith(".ld"):
-                    original_linker_script_path = os.path.join(original_makefile_base_dir, item)
-                    dest_linker_script_path = os.path.join(output_dir, item)
-                    if os.path.isfile(original_linker_script_path):
-                        shutil.copy2(original_linker_script_path, dest_linker_script_path)
-                        print(f"  Copied Linker Script from '{original_linker_script_path}' to: {dest_linker_script_path}")
+            # scandir's DirEntry.is_file() uses the type returned by the directory listing,
+            # avoiding an extra stat per entry
+            with os.scandir(original_makefile_base_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".ld") and entry.is_file():
+                        dest_linker_script_path = os.path.join(output_dir, entry.name)
+                        shutil.copy2(entry.path, dest_linker_script_path)
+                        print(f"  Copied Linker Script from '{entry.path}' to: {dest_linker_script_path}")
                         linker_script_copied = True
                         break # Assume only one relevant .ld file
             if not linker_script_copied:
@@ -412,109 +724,70 @@ def main(project_file_path, output_dir, makefile_dir=None): # Add makefile_dir p
 
             # Read the copied Makefile content
             with open(dest_makefile_path, 'r', encoding='utf-8') as f:
-                makefile_lines = f.readlines()
+                makefile_content = f.read()
 
-            modified_makefile_lines = []
             sdk_root_updated = False
-            proj_dir_defined = False
             cflags_inserted = False # Flag to track CFLAGS insertion
 
             # Define the new PROJ_DIR and SDK_ROOT lines
             new_proj_dir_line = 'PROJ_DIR := ./\n'
             new_sdk_root_definition = f'SDK_ROOT := $(PROJ_DIR)/{SDK_FILES_SUBDIR}\n'
-            original_sdk_root_pattern = r'^SDK_ROOT\s*:=\s*\.\./\.\./\.\./\.\./\.\./\.\.'
-            target_cflags_line = 'CFLAGS += -fno-builtin -fshort-enums' # Line to insert after
-
-            for line in makefile_lines:
-                # Check if the line defines SDK_ROOT
-                match = re.match(original_sdk_root_pattern, line)
-                if match and not sdk_root_updated:
-                    # Insert PROJ_DIR before SDK_ROOT if not already done
-                    if not proj_dir_defined:
-                        modified_makefile_lines.append(new_proj_dir_line)
-                        proj_dir_defined = True
-                        print(f"  Defined PROJ_DIR in Makefile.")
-                    # Replace the SDK_ROOT line
-                    modified_makefile_lines.append(new_sdk_root_definition)
+
+            # All modifications are dispatched from one MAKEFILE_PATTERN.sub call, so the
+            # Makefile text is scanned exactly once
+            makefile_sub_counts = dict.fromkeys(('config_inc', 'config_file', 'config_dir', 'main_c'), 0)
+
+            def replace_makefile_match(match):
+                nonlocal sdk_root_updated, cflags_inserted
+                kind = match.lastgroup
+                if kind == 'proj_dir':
+                    # Remove the line defining the original PROJ_DIR
+                    print(f"  Removed line defining PROJ_DIR: {match[kind].strip()}")
+                    return ''
+                if kind == 'sdk_root':
+                    if sdk_root_updated:
+                        return match[0] # Only the first definition is replaced
+                    # Insert PROJ_DIR before SDK_ROOT and replace the SDK_ROOT line
                     sdk_root_updated = True
+                    print(f"  Defined PROJ_DIR in Makefile.")
                     print(f"  Updated SDK_ROOT path in Makefile.")
-                else:
-                    # Keep the original line
-                    modified_makefile_lines.append(line)
-
-                # Check if this is the line to insert CFLAGS after
-                if line.strip() == target_cflags_line:
-                    modified_makefile_lines.append('CFLAGS += -Wall -Werror\n')
-                    modified_makefile_lines.append('CFLAGS += -Wno-array-bounds\n')
+                    return new_proj_dir_line + new_sdk_root_definition
+                if kind == 'cflags':
                     cflags_inserted = True
-                    print(f"  Inserted additional CFLAGS after '{target_cflags_line}'.")
+                    print(f"  Inserted additional CFLAGS after '{TARGET_CFLAGS_LINE}'.")
+                    return match[0] + 'CFLAGS += -Wall -Werror\n' + 'CFLAGS += -Wno-array-bounds\n'
+                makefile_sub_counts[kind] += 1
+                if kind == 'config_inc':
+                    return '-I$(PROJ_DIR)/config'
+                if kind == 'config_file':
+                    return f'$(PROJ_DIR)/config/{match[kind]}'
+                if kind == 'config_dir':
+                    return '$(PROJ_DIR)/config \\\n'
+                return '$(SDK_ROOT)/main.c '
+
+            modified_makefile_content = MAKEFILE_PATTERN.sub(replace_makefile_match, makefile_content)
 
             # If SDK_ROOT wasn't found/updated, add PROJ_DIR and SDK_ROOT at the beginning (or a suitable place)
             if not sdk_root_updated:
                  print(f"  Warning: Original SDK_ROOT pattern not found. Adding PROJ_DIR and new SDK_ROOT definition near the top.")
-                 # Insert after the first few lines (e.g., after PROJECT_NAME) or at the beginning
-                 insert_pos = 0
-                 for i, line in enumerate(modified_makefile_lines):
-                     if line.startswith('PROJECT_NAME'):
-                         insert_pos = i + 1
-                         break
-                 if not proj_dir_defined:
-                     modified_makefile_lines.insert(insert_pos, new_proj_dir_line)
-                     proj_dir_defined = True
-                 modified_makefile_lines.insert(insert_pos + 1, new_sdk_root_definition)
+                 # Insert after the PROJECT_NAME line, or at the beginning
+                 project_name_match = PROJECT_NAME_LINE_PATTERN.search(modified_makefile_content)
+                 insert_pos = project_name_match.end() if project_name_match else 0
+                 modified_makefile_content = (modified_makefile_content[:insert_pos] + new_proj_dir_line
+                                              + new_sdk_root_definition + modified_makefile_content[insert_pos:])
 
             # Report if CFLAGS insertion failed
             if not cflags_inserted:
-                print(f"  Warning: Target line '{target_cflags_line}' not found. Additional CFLAGS were not inserted.")
-
-            modified_makefile_content = "".join(modified_makefile_lines)
-
-            # --- Apply other Makefile modifications (config paths) ---
-            # Ensure config paths use PROJ_DIR relative to the Makefile location
-            # Replace '-I../config' with '-I$(PROJ_DIR)/config'
-            original_config_include_pattern = r'(-I)\.\./config'
-            new_config_include = r'\1$(PROJ_DIR)/config' # Use PROJ_DIR
-            modified_makefile_content, num_config_inc_subs = re.subn(
-                original_config_include_pattern,
-                new_config_include,
-                modified_makefile_content
-            )
-            if num_config_inc_subs > 0:
-                print(f"  Updated {num_config_inc_subs} config include path(s) in Makefile.")
-
-            # Replace '../config/sdk_config.h' with '$(PROJ_DIR)/config/sdk_config.h'
-            # Make the pattern more general for any file within ../config/
-            original_config_file_pattern = r'\.\./config/([^\s]+)' # Match ../config/ followed by non-whitespace chars
-            new_config_file = r'$(PROJ_DIR)/config/\1' # Use PROJ_DIR
-            modified_makefile_content, num_config_file_subs = re.subn(
-                original_config_file_pattern,
-                new_config_file,
-                modified_makefile_content
-            )
-            if num_config_file_subs > 0:
-                print(f"  Updated {num_config_file_subs} config file path(s) in Makefile.")
-
-            # Replace '../config \' with '$(PROJ_DIR)/config \'
-            original_config_dir_pattern = r'\.\./config \\\n' # Match '../config \' at the end of a line
-            new_config_dir = r'$(PROJ_DIR)/config \\\n' # Use PROJ_DIR
-            modified_makefile_content, num_config_dir_subs = re.subn(
-                original_config_dir_pattern,
-                new_config_dir,
-                modified_makefile_content
-            )
-            if num_config_dir_subs > 0:
-                print(f"  Updated {num_config_dir_subs} '../config \\' path(s) in Makefile.")
-
-            # --- Add step to replace "$(PROJ_DIR)/main.c " with "$(SDK_ROOT)/main.c " ---
-            original_main_c_pattern = r'\$\(PROJ_DIR\)/main\.c '
-            new_main_c_path = r'$(SDK_ROOT)/main.c '
-            modified_makefile_content, num_main_c_subs = re.subn(
-                original_main_c_pattern,
-                new_main_c_path,
-                modified_makefile_content
-            )
-            if num_main_c_subs > 0:
-                print(f"  Updated {num_main_c_subs} 'main.c' path(s) in Makefile.")
+                print(f"  Warning: Target line '{TARGET_CFLAGS_LINE}' not found. Additional CFLAGS were not inserted.")
+
+            if makefile_sub_counts['config_inc'] > 0:
+                print(f"  Updated {makefile_sub_counts['config_inc']} config include path(s) in Makefile.")
+            if makefile_sub_counts['config_file'] > 0:
+                print(f"  Updated {makefile_sub_counts['config_file']} config file path(s) in Makefile.")
+            if makefile_sub_counts['config_dir'] > 0:
+                print(f"  Updated {makefile_sub_counts['config_dir']} '../config \\' path(s) in Makefile.")
+            if makefile_sub_counts['main_c'] > 0:
+                print(f"  Updated {makefile_sub_counts['main_c']} 'main.c' path(s) in Makefile.")
 
             # --- End of other modifications ---
 
@@ -528,75 +801,92 @@ def main(project_file_path, output_dir, makefile_dir=None): # Add makefile_dir p
     else:
         print(f"Warning: Makefile not found at {original_makefile_path}. Skipping Makefile processing.")
 
-    # --- Modify Makefile ---
-    print("Modifying Makefile...")
-    makefile_path = os.path.join(output_dir, 'Makefile')
-
-    if os.path.isfile(makefile_path):
-        try:
-            with open(makefile_path, 'r', encoding='utf-8') as f:
-                makefile_lines = f.readlines()
-
-            modified_makefile_lines = []
-            for line in makefile_lines:
-                # Remove the line defining PROJ_DIR
-                if line.strip().startswith('PROJ_DIR := ../../..'):
-                    print(f"  Removed line defining PROJ_DIR: {line.strip()}")
-                    continue  # Skip adding this line to the modified content
-                modified_makefile_lines.append(line)
-
-            # Write the modified content back
-            with open(makefile_path, 'w', encoding='utf-8') as f:
-                f.writelines(modified_makefile_lines)
-
-            print("Successfully removed PROJ_DIR definition from Makefile.")
-
-        except Exception as e:
-            print(f"Error modifying Makefile: {e}")
+    clear_path_probes() # The Makefile and linker script were just written
 
     # --- Modify Makefile.posix ---
     print("Modifying Makefile.posix...")
+    # The outcome and the closing summary are collected and written to stdout in one call
+    closing_messages = []
     # Construct the expected path within the output directory
-    makefile_posix_rel_path = os.path.join(SDK_FILES_SUBDIR, 'components', 'toolchain', 'gcc', 'Makefile.posix')
-    makefile_posix_abs_path = os.path.join(output_dir, makefile_posix_rel_path)
-
-    if os.path.isfile(makefile_posix_abs_path):
+    sdk_gcc_abs_dir = os.path.join(os.fsencode(output_dir), SDK_GCC_DIR_BYTES)
+    makefile_posix_abs_path = os.path.join(sdk_gcc_abs_dir, b'Makefile.posix')
+    makefile_posix_display_path = os.fsdecode(makefile_posix_abs_path) # For messages only
+
+    # Open directly instead of probing with os.path.isfile first: a missing file surfaces
+    # as FileNotFoundError (or NotADirectoryError) from os.open itself, and the fstat
+    # below stands in for the directory check. Raw file descriptors skip the io object setup.
+    posix_sentinel_path = os.path.join(sdk_gcc_abs_dir, GCC_PATCH_SENTINEL_BYTES)
+    try:
         try:
-            with open(makefile_posix_abs_path, 'r', encoding='utf-8') as f:
-                posix_content = f.read()
-
-            original_gcc_path = "/usr/local/gcc-arm-none-eabi-9-2020-q2-update/bin/"
-            new_gcc_path = "/usr/local/bin/" # Only replace the directory part
-
-            modified_posix_content = posix_content.replace(original_gcc_path, new_gcc_path)
+            with open(posix_sentinel_path, 'rb') as f:
+                checked_signature = f.read()
+        except OSError:
+            checked_signature = None # Never checked (or unreadable): do the full scan
+
+        # Scan a read-only memory map rather than decoding the whole file into a str;
+        # the common already-patched case never copies the contents at all.
+        modified_posix_content = None
+        fd = os.open(makefile_posix_abs_path, os.O_RDONLY | O_BINARY)
+        try:
+            posix_stat = os.fstat(fd)
+            if not stat.S_ISREG(posix_stat.st_mode):
+                raise IsADirectoryError(makefile_posix_abs_path)
+            already_checked = stat_signature(posix_stat) == checked_signature
+            if posix_stat.st_size > 0 and not already_checked: # Empty files can't be memory-mapped
+                with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+                    if mm.find(ORIGINAL_GCC_PATH_BYTES) != -1:
+                        modified_posix_content = mm[:].replace(ORIGINAL_GCC_PATH_BYTES, NEW_GCC_PATH_BYTES)
+        finally:
+            os.close(fd)
+
+        if modified_posix_content is not None:
+            # The file may be a hard link into the SDK (--link); unlink it first so
+            # the rewrite creates a new file instead of modifying the SDK copy.
+            os.unlink(makefile_posix_abs_path)
+            fd = os.open(makefile_posix_abs_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | O_BINARY, 0o666)
+            try:
+                remaining = memoryview(modified_posix_content)
+                while remaining: # os.write may write less than asked
+                    remaining = remaining[os.write(fd, remaining):]
+                posix_stat = os.fstat(fd)
+            finally:
+                os.close(fd)
+            closing_messages.append(f"  Updated GNU toolchain path in: {makefile_posix_display_path}\n")
+        else:
+            closing_messages.append(f"  GNU toolchain path already correct or not found in: {makefile_posix_display_path}\n")
 
-            if modified_posix_content != posix_content:
-                with open(makefile_posix_abs_path, 'w', encoding='utf-8') as f:
-                    f.write(modified_posix_content)
-                print(f"  Updated GNU toolchain path in: {makefile_posix_abs_path}")
-            else:
-                print(f"  GNU toolchain path already correct or not found in: {makefile_posix_abs_path}")
+        # Record the checked version; failing to is harmless, the next run just rescans
+        if not already_checked:
+            try:
+                with open(posix_sentinel_path, 'wb') as f:
+                    f.write(stat_signature(posix_stat))
+            except OSError:
+                pass
 
-        except Exception as e:
-            print(f"Error processing Makefile.posix {makefile_posix_abs_path}: {e}")
-    else:
-        print(f"Warning: Makefile.posix not found at {makefile_posix_abs_path}. Skipping modification.")
-        # Check if Makefile.common exists as a fallback check
-        makefile_common_check_path = os.path.join(output_dir, SDK_FILES_SUBDIR, 'components', 'toolchain', 'gcc', 'Makefile.common')
-        if not os.path.isfile(makefile_common_check_path):
-             print(f"  Also note: Makefile.common not found at expected location. Toolchain files might be missing.")
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        closing_messages.append(f"Warning: Makefile.posix not found at {makefile_posix_display_path}. Skipping modification.\n")
+        # Check if Makefile.common exists as a fallback check (only needed on this path)
+        makefile_common_check_path = os.path.join(sdk_gcc_abs_dir, b'Makefile.common')
+        if not _isfile_cached(makefile_common_check_path):
+             closing_messages.append(f"  Also note: Makefile.common not found at expected location. Toolchain files might be missing.\n")
+    except OSError as e:
+        closing_messages.append(f"Error processing Makefile.posix {makefile_posix_display_path}: {e}\n")
 
 
-    print("Standalone project creation process finished.")
-    print(f"Output located at: {os.path.abspath(output_dir)}")
+    closing_messages.append("Standalone project creation process finished.\n")
+    closing_messages.append(f"Output located at: {output_dir}\n")
+    sys.stdout.write("".join(closing_messages))
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Create a standalone Segger Embedded Studio project.')
-    parser.add_argument('project_file', help='Path to the source .emProject file.')
-    parser.add_argument('output_dir', help='Path to the directory where the standalone project will be created.')
+    # Paths are made absolute once at parse time; main's own to_abs_path calls then
+    # reduce to a normpath with no getcwd() syscall
+    parser.add_argument('project_file', type=to_abs_path, help='Path to the source .emProject file.')
+    parser.add_argument('output_dir', type=to_abs_path, help='Path to the directory where the standalone project will be created.')
     # Add the optional makefile directory argument
-    parser.add_argument('--makefile-dir', help='Optional path to the directory containing the Makefile. Defaults to the project file directory.')
+    parser.add_argument('--makefile-dir', type=to_abs_path, help='Optional path to the directory containing the Makefile. Defaults to the project file directory.')
+    parser.add_argument('--link', action='store_true', help='Hard-link SDK files into the output instead of copying them (falls back to copying across devices). Linked files share data with the SDK, so do not edit them in place.')
 
     args = parser.parse_args()
 
@@ -605,4 +895,4 @@ if __name__ == "__main__":
         sys.exit(1)
 
     # Pass the makefile_dir argument to main
-    main(args.project_file, args.output_dir, args.makefile_dir)
+    main(args.project_file, args.output_dir, args.makefile_dir, args.link)